@@ -43,6 +43,9 @@
                     2015 31 Aug - Prevent too many successive quick restarts.
                     2015 09 Sep - Work around to handle hostnames which do not
                         have a domain
+                    2026 14 Oct - Ping standby hosts in parallel.
+                    2026 14 Oct - SIGHUP ends the current heartbeat wait early
+                        and reloads the standby list.
  ------------------------------------------------------------------------------
 
   Algorithm
@@ -59,14 +62,25 @@
  from checkpoint files from both tegu's are compared, and the tegu with the
  older checkpoint is deactivated. The rationale is that the F5 only keeps a
  single tegu active at a time, so the tegu with the most recent checkpoint
- ought to be the active one.'''
+ ought to be the active one. If the newest checkpoints on both sides have
+ the same content (sha256) the timestamps are not compared; the host names
+ decide instead. Sending the script a SIGHUP rereads the standby_list. It
+ also ends the current heartbeat wait and runs the next heartbeat
+ immediately, but it only restarts the priority backoff, never ends it.'''
 
-import sys
 import time
 import os
 import socket
 import subprocess
-import string
+import threading
+import glob
+import tarfile
+import httplib
+import hashlib
+import select
+import signal
+import fcntl
+import errno
 
 # Directory locations
 TEGU_ROOT = os.getenv('TEGU_ROOT', '/var')              # Tegu root dir
@@ -80,8 +94,18 @@ LOGFILE = LOGDIR+'/tegu_ha.log'				            # log file for this script
 TEGU_PORT = os.getenv('TEGU_PORT', 29444)		     # tegu's api listen port
 TEGU_USER = os.getenv('TEGU_USER', 'tegu')           # run only under tegu user
 TEGU_PROTO = 'http'
-
-SSH_CMD = 'ssh -o StrictHostKeyChecking=no %s@%s '
+API_CONN = httplib.HTTPSConnection if TEGU_PROTO == 'https' \
+    else httplib.HTTPConnection
+
+# Multiplex ssh sessions so the several commands sent to a host while
+# resolving a split brain share one connection (and one handshake). The
+# control sockets live in tegu's lib directory: ssh doesn't check who
+# owns a socket, so one in a world writable place like /tmp could be
+# planted by another user.
+SSH_CMD = ['ssh', '-o', 'StrictHostKeyChecking=no', '-o', 'ControlMaster=auto',
+           '-o', 'ControlPath=' + LIBDIR + '/ssh-%r@%h:%p', '-o', 'ControlPersist=60s',
+           '-o', 'ConnectTimeout=3', '-o', 'ServerAliveInterval=2',
+           '-o', 'ServerAliveCountMax=2']
 
 RETRY_COUNT = 3      # How many times to retry ping command
 CONNECT_TIMEOUT = 3  # Ping timeout
@@ -99,6 +123,10 @@ SYNC_CMD = '/usr/bin/tegu_synch'
 # HA Configuration
 HEARTBEAT_SEC = 5                    # Heartbeat interval in seconds
 PRI_WAIT_SEC = 5                     # Backoff to let higher prio tegu take over
+CMD_TIMEOUT = 2*HEARTBEAT_SEC        # Limit on stop commands
+ACTIVATE_TIMEOUT = 120               # Limit on start (tegu_standby off restores chkpts)
+SYNCH_HOST_SEC = 30                  # Limit per standby copied to in a chkpt synch
+                                     # (tegu_synch's scp gives up connecting after 10s)
 STDBY_LIST = ETCDIR + '/standby_list' # list of other hosts that might run tegu
 
 # if present then this is a standby machine and we don't start
@@ -107,13 +135,22 @@ VERBOSE = 0
 
 TEGUCONF_FILE = ETCDIR + '/tegu.cfg'
 
+# persistent connections to each host's tegu api. These (and the wakeup
+# pipe) must not leak into the daemons we start, so every subprocess is
+# run with close_fds=True.
+api_conns = {}
+last_digest = (None, 0, None)   # path, mtime and digest of last chkpt hashed
+wake_r = wake_w = None  # self-pipe used to end a heartbeat wait early
+host_cfg = {}       # per host short name and ssh argv, built on first use
+
 def logit(msg):
-    '''Log error message on stdout with timestamp'''
+    '''Log error message on stderr with timestamp. The line goes out in
+       a single unbuffered write so lines from the ping threads cannot
+       interleave.'''
     now = time.gmtime()
-    sys.stderr.write("%4d/%02d/%02d %02d:%02d %s\n" %
-                     (now.tm_year, now.tm_mon, now.tm_mday,
-                      now.tm_hour, now.tm_min, msg))
-    sys.stderr.flush()
+    os.write(2, "%4d/%02d/%02d %02d:%02d %s\n" %
+             (now.tm_year, now.tm_mon, now.tm_mday,
+              now.tm_hour, now.tm_min, msg))
 
 def crit(msg):
     '''Print critical message to log'''
@@ -127,20 +164,37 @@ def warn(msg):
     '''Print warning message to log'''
     logit("WRN: " + msg)
 
-def ssh_cmd(host):
-    '''Return ssh command line for host. Empty host imples local execution.'''
+def host_info(host):
+    '''Return the per host values (short name, ssh argv prefix) for host,
+       building them the first time the host is seen.'''
+    info = host_cfg.get(host)
+    if info is None:
+        info = {'short': host.split('.')[0],
+                'ssh':   SSH_CMD + [TEGU_USER + '@' + host]}
+        host_cfg[host] = info
+    return info
+
+def ssh_cmd(host, cmd, limit=CMD_TIMEOUT):
+    '''Return argv to run the shell command cmd on host. Empty host imples
+       local execution. A remote command is run by the remote shell, so
+       no local shell is needed to get it there. The command is killed
+       by timeout(1) after limit seconds so that a hung host cannot stall
+       the heartbeat loop; it then exits 124, which the subprocess calls
+       report as any other failure. Locally --foreground is used so that
+       only the shell is killed; without it timeout signals its whole
+       process group, which includes the daemons start_tegu and
+       start_tegu_agent leave running in the background.'''
     if host != '':
-        return SSH_CMD % (TEGU_USER, host)
-    return ''
-
-def get_checkpoint(host=''):
-    '''Fetches checkpoint files from specified host.'''
-    ssh_prefix = ssh_cmd(host)
+        return ['timeout', str(limit)] + host_info(host)['ssh'] + [cmd]
+    return ['timeout', '--foreground', str(limit), '/bin/sh', '-c', cmd]
 
+def get_checkpoint(limit, host=''):
+    '''Fetches checkpoint files from specified host, giving up after
+       limit seconds.'''
     try:
-        subprocess.check_call(ssh_prefix + SYNC_CMD, shell="True")
+        subprocess.check_call(ssh_cmd(host, SYNC_CMD, limit), close_fds=True)
         return True
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, OSError):
         warn("Could not sync chkpts from %s" % host)
     return False
 
@@ -171,140 +225,302 @@ def parse_teguconfig():
         logit("unable to open %s file for some reason" % TEGUCONF_FILE)
     return
 
-def extract_dt(dt_str, dt_col, tm_col):
+def local_digest(path, mtime):
+    '''
+        Returns the sha256 digest of one of our checkpoint files. The digest
+        of the last file hashed is remembered along with its mtime so that
+        it is only recomputed after the checkpoint has been rewritten.
+    '''
+    global last_digest
+
+    if last_digest[:2] != (path, mtime):
+        with open(path, 'rb') as chkpt:
+            last_digest = (path, mtime, hashlib.sha256(chkpt.read()).hexdigest())
+    return last_digest[2]
+
+def latest_local_chkpt():
     '''
-        Given a string assumed to be from a long ls listing or
-        from a verbose tar output, extract the date and time
-        and return the unix timestamp. If the time/date components
-        are not recognisable, then returns 0.
+        Returns the modification time (unix timestamp) and the digest of the
+        most recent of our resmgr_ checkpoint files, or (0, None) if there
+        are none.
     '''
-    # prevent stack dump if missing time, or wrong format
+    newest = 0
+    newest_path = None
     try:
-        toks = string.split(dt_str)
-        # ls listing has decimal which python %S cannot handle
-        ttoks = string.split(toks[tm_col], ".")
-        # build time object
-        tobj = time.strptime(toks[dt_col] + " " + ttoks[0], "%Y-%m-%d %H:%M:%S")
-        return int(time.mktime(tobj))
-    except (ValueError, IndexError):
-        logit("unable to build a timestamp from: %s and %s"
-              % (toks[dt_col], ttoks[0]))
-    return 0
-
-def should_be_active(host):
-    '''Returns True if host should be active as opposed to current node'''
-
-    # need short name for ls command
-    htoks = string.split(host, ".")
-
-    # Cmd to suss out the most recent checkpoint file that was in the
-    # most recent tar from host.  Sort to ensure order by date from
-    # tar output then take first. Redirect stderr to null because
-    # python doesn't ignore closed pipe signals and thus they
-    # propagate causing sort and grep to complain once for each line
-    # of output it tries to write after head closes the pipe.
-    ts_r_cmd = 'tar -t -v --full-time -f $(ls -t ' + LIBDIR + '/chkpt_synch.'\
-        + htoks[0] + '.*.tgz | head -1) | (grep resmgr_ | sort -r -k 4,5 '\
-        + '| head -1) 2>/dev/null'
-
-    # cmd to suss out the long listing of the most recent of our
-    # checkpoint files. Specifically look for resmgr_ files as there
-    # might be other files in the directory. -F and grep -v might be
-    # overkill, but aren't harmful.
-    ts_l_cmd = 'ls --full-time -tF ' + CKPTDIR + '/resmgr_* '\
-        + '| grep -v "\\/\\$" 2>/dev/null' + '| head -1'
-
-    # Pull latest checkpoint from remote node
-    # If theres an error, the other guy shouldn't be primary
-    if not get_checkpoint(host):
-        return False
-    if not get_checkpoint():
-        return True
+        for name in os.listdir(CKPTDIR):
+            path = os.path.join(CKPTDIR, name)
+            if name.startswith('resmgr_') and os.path.isfile(path):
+                mtime = int(os.path.getmtime(path))
+                if mtime > newest:
+                    newest = mtime
+                    newest_path = path
+        if newest_path is not None:
+            return newest, local_digest(newest_path, newest)
+    except (OSError, IOError):
+        logit("unable to scan checkpoint directory: %s" % CKPTDIR)
+    return 0, None
+
+def latest_synch_chkpt(short_name):
+    '''
+        Returns the timestamp and digest of the most recent resmgr_
+        checkpoint file in the most recent synch tar received from the
+        named host (short name), or (0, None) if there is no tar or it
+        holds no checkpoint files.
+    '''
+    synch_files = glob.glob(LIBDIR + '/chkpt_synch.' + short_name + '.*.tgz')
+    if not synch_files:
+        return 0, None
 
-    # Check if we or they have latest checkpoint
+    synch_file = max(synch_files, key=os.path.getmtime)
+    try:
+        with tarfile.open(synch_file, 'r:gz') as tar:
+            chkpts = [m for m in tar.getmembers() if m.isfile()
+                      and os.path.basename(m.name).startswith('resmgr_')]
+            if chkpts:
+                newest = max(chkpts, key=lambda m: m.mtime)
+                data = tar.extractfile(newest).read()
+                return newest.mtime, hashlib.sha256(data).hexdigest()
+    except (tarfile.TarError, IOError, OSError):
+        logit("unable to read chkpt synch file: %s" % synch_file)
+    return 0, None
+
+def should_be_active(host, chkpt_l, limit):
+    '''Returns True if host should be active as opposed to current node.
+       chkpt_l is the (timestamp, digest) of our most recent checkpoint.
+       Each chkpt synch is given limit seconds.'''
+
+    # Only need a new synch if the newest checkpoint in the tar we hold
+    # from host isn't its current one. tegu_synch exits 0 even when its
+    # copy to us fails, so this is judged from what actually arrived; an
+    # undelivered synch is simply retried next time.
+    short_name = host_info(host)['short']
+    held = latest_synch_chkpt(short_name)
+    last = held[0] or -1        # nothing usable held: always synch
+
+    # Have host push its latest checkpoint to us (if needed) and report
+    # its checkpoint time and clock in a single ssh round trip. Synch
+    # chatter goes to stderr (our log) so that stdout is just the synch
+    # exit code, the remote chkpt time and the remote time.
+    remote_cmd = ('cur=$(stat -c %%Y %s/resmgr_* 2>/dev/null | sort -n | tail -1); '
+                  'if [ "${cur:-0}" != "%d" ]; then %s 1>&2; echo $?; '
+                  'else echo 0; fi; echo ${cur:-0}; /bin/date +%%s') \
+                  % (CKPTDIR, last, SYNC_CMD)
+    synch_cmd = ssh_cmd(host, remote_cmd, limit)
     try:
-        # Get clock skew
-        logit("checking clock skew: " + ssh_cmd(host) + 'date +%s')
-
-        # I don't grok why shell=True is needed, but it fails without
-        time_r = int(subprocess.check_output(ssh_cmd(host) + '/bin/date +%s',
-                                             shell=True))
-        time_l = int(subprocess.check_output(ssh_cmd('') + 'date +%s',
-                                             shell=True))
+        logit("synching chkpts and checking clock skew: " + host)
+        toks = subprocess.check_output(synch_cmd, close_fds=True).split()
+        time_l = int(time.time())
+        synch_rc = int(toks[0])
+        chkpt_r = int(toks[1])
+        time_r = int(toks[2])
         skew = time_l-time_r
 
-        # Get ours and their checkpoint file info
-        # get ls listing info string
-        ts_r_s = subprocess.check_output(ts_r_cmd, shell=True)
-        ts_l_s = subprocess.check_output(ts_l_cmd, shell=True)
+    except (subprocess.CalledProcessError, OSError, ValueError, IndexError):
+        warn("Could not get chkpt timestamps")
+        return False
 
-        if ts_r_s == "" or ts_l_s == "":
-            logit("unable to find chkpt file info host:" + host)
-            return False
+    # If theres an error, the other guy shouldn't be primary
+    if synch_rc != 0:
+        warn("Could not sync chkpts from %s" % host)
+        return False
+    if not get_checkpoint(limit):
+        return True
 
-        # convert listing strings in numeric timestamps
-        ts_r = extract_dt(ts_r_s, 3, 4)
-        ts_l = extract_dt(ts_l_s, 5, 6)
+    # Timestamp of their most recent checkpoint, from the tar they just
+    # sent us or, if it was current, the one we already had. A tar that
+    # still isn't host's current checkpoint means the synch never got
+    # here, so its digest says nothing either: treat it as a failed synch.
+    if chkpt_r == last:
+        logit("chkpts on " + host + " unchanged since last synch, not synched")
+        ts_r, digest_r = held
+    else:
+        ts_r, digest_r = latest_synch_chkpt(short_name)
+        if ts_r != chkpt_r:
+            warn("chkpt on %s is %d but the synch tar we hold from it has %d"
+                 % (host, chkpt_r, ts_r))
+            return False
+    ts_l, digest_l = chkpt_l
 
-        return ts_r+skew > ts_l or \
-            (ts_r+skew == ts_l and host < socket.getfqdn())
+    if ts_r == 0 or ts_l == 0:
+        logit("unable to find chkpt file info host:" + host)
+        return False
 
-    except subprocess.CalledProcessError:
-        warn("Could not get chkpt timestamps")
+    # Same checkpoint on both sides: neither is more current, so skip the
+    # clock based comparison and just use the tie-breaker
+    if digest_r == digest_l:
+        logit("chkpt from " + host + " matches ours")
+        return host < socket.getfqdn()
 
-    return False
+    return ts_r+skew > ts_l or \
+        (ts_r+skew == ts_l and host < socket.getfqdn())
 
 def is_active(host='localhost'):
     '''Return True if tegu is running on host
        If host is None, check if tegu is running on current host
        Use ping API check, standby file may be inconsistent'''
 
-    # must use no-proxy to avoid proxy servers gumming up the works
-    # grep stderr redirected to avoid pipe complaints
-    curl_str = ('curl --noproxy \'*\' --connect-timeout %d -s -d '\
-                + '"ping" %s://%s:%d/tegu/api | grep -q -i pong 2>/dev/null')\
-                % (CONNECT_TIMEOUT, TEGU_PROTO, host, TEGU_PORT)
+    # connections are kept open between heartbeats; httplib never uses a
+    # proxy so there are no proxy servers to gum up the works
     for i in xrange(RETRY_COUNT):
+        conn = api_conns.get(host)
+        if conn is None:
+            conn = API_CONN(host, int(TEGU_PORT), timeout=CONNECT_TIMEOUT)
+            api_conns[host] = conn
         try:
-            subprocess.check_call(curl_str, shell=True)
-            return True
-        except subprocess.CalledProcessError:
+            conn.request('POST', '/tegu/api', 'ping')
+            if 'pong' in conn.getresponse().read().lower():
+                return True
             continue
+        except (httplib.HTTPException, socket.error):
+            pass
+        # connection is broken (or was closed by tegu); start over
+        conn.close()
+        del api_conns[host]
     return False
 
+def wakeup(signum, frame):
+    '''SIGHUP handler: cut the current heartbeat wait short.'''
+    try:
+        os.write(wake_w, 'x')
+    except OSError:
+        pass            # pipe is full, a wakeup is already pending
+
+def setup_wakeup():
+    '''Create the self-pipe written by the SIGHUP handler.'''
+    global wake_r, wake_w
+
+    wake_r, wake_w = os.pipe()
+    for fd in (wake_r, wake_w):
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    signal.signal(signal.SIGHUP, wakeup)
+
+def nap(sec):
+    '''Wait for sec seconds, or until a SIGHUP arrives. Returns True if
+       woken by SIGHUP.'''
+    try:
+        if not select.select([wake_r], [], [], sec)[0]:
+            return False
+    except select.error as e:
+        if e.args[0] != errno.EINTR:       # python 2 doesn't restart select
+            raise
+
+    try:
+        while os.read(wake_r, 64):          # drain pending wakeups
+            pass
+    except OSError:
+        pass
+    return True
+
+def ping_hosts(hosts):
+    '''Ping all hosts concurrently. Returns a dict mapping each host to
+       True if tegu is running there. Takes roughly as long as the slowest
+       host rather than the sum of all of them.'''
+    results = {}
+
+    def ping(host):
+        results[host] = is_active(host)
+
+    threads = [threading.Thread(target=ping, args=(host,)) for host in hosts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
 def deactivate_tegu(host=''):
     ''' Deactivate tegu on a given host. If host is omitted, local
-        tegu is stopped. Returns True if successful, False on error.'''
-    ssh_prefix = ssh_cmd(host)
+        tegu is stopped. The whole of DEACTIVATE_CMD, including the
+        killalls, runs on host. Returns True if successful, False on error.'''
     try:
-        subprocess.check_call(ssh_prefix + DEACTIVATE_CMD, shell=True)
+        subprocess.check_call(ssh_cmd(host, DEACTIVATE_CMD), close_fds=True)
         return True
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, OSError):
         return False
 
 def activate_tegu(host=''):
     ''' Activate tegu on a given host. If host is omitted, local
         tegu is started. Returns True if successful, False on error.'''
-    if host != '':
-        host = SSH_CMD % (TEGU_USER, host)
     try:
-        subprocess.check_call(host + ACTIVATE_CMD, shell=True)
+        subprocess.check_call(ssh_cmd(host, ACTIVATE_CMD, ACTIVATE_TIMEOUT),
+                              close_fds=True)
         return True
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, OSError):
         return False
 
-def main_loop(standby_list, this_node, priority):
+def read_standby_list(fqdn_list):
+    '''
+        Reads the standby list in a single pass and finds us in it using
+        any of the names in fqdn_list. Returns (this_node, priority, others)
+        where priority is our position in the list and others holds the rest
+        of the hosts. this_node and priority are None if we aren't listed.
+    '''
+    this_node = None
+    priority = None
+    others = []
+    with open(STDBY_LIST, 'r') as sfile:
+        for line in sfile:
+            host = line.strip()
+            if host == '':
+                continue
+            if this_node is None and host in fqdn_list:
+                this_node = host
+                priority = len(others)
+            else:
+                others.append(host)
+    return this_node, priority, others
+
+def reload_standby_list(fqdn_list, this_node, priority, standby_list):
+    '''
+        Rereads the standby list after a SIGHUP. Returns the new (this_node,
+        priority, standby_list), or the ones passed in if the list cannot be
+        read or no longer names us. Connections to hosts that were dropped
+        from the list are closed and their host_cfg entries removed.
+    '''
+    try:
+        node, pri, others = read_standby_list(fqdn_list)
+    except IOError:
+        warn("unable to reload standby list: %s" % STDBY_LIST)
+        return this_node, priority, standby_list
+
+    if node is None:
+        warn("host %s no longer in standby list: %s (list not reloaded)"
+             % (this_node, STDBY_LIST))
+        return this_node, priority, standby_list
+
+    for host in list(api_conns):
+        if host != 'localhost' and host not in others:
+            api_conns.pop(host).close()
+    for host in list(host_cfg):
+        if host not in others:
+            del host_cfg[host]
+
+    logit("reloaded standby list: %s (priority %d)" % (STDBY_LIST, pri))
+    return node, pri, others
+
+def main_loop(fqdn_list, standby_list, this_node, priority):
     '''Main heartbeat and liveness check loop'''
     quick_start = 0           # number of restarts close together
     last_start = 0
     priority_wait = False
     while True:
         if not priority_wait:
-            # Normal heartbeat
-            time.sleep(HEARTBEAT_SEC)
+            # Normal heartbeat; a SIGHUP ends it early and reloads the
+            # standby list
+            if nap(HEARTBEAT_SEC):
+                this_node, priority, standby_list = reload_standby_list(
+                    fqdn_list, this_node, priority, standby_list)
         else:
             # No tegu running. Wait for higher priority tegu to activate.
-            time.sleep(PRI_WAIT_SEC*priority)
+            # A SIGHUP reloads the standby list and restarts this wait with
+            # the (possibly new) priority. It must never end it early:
+            # every waiting node would then start tegu at once.
+            end = time.time() + PRI_WAIT_SEC*priority
+            while time.time() < end:
+                if nap(max(0, end - time.time())):
+                    this_node, priority, standby_list = reload_standby_list(
+                        fqdn_list, this_node, priority, standby_list)
+                    end = time.time() + PRI_WAIT_SEC*priority
 
         i_am_active = is_active()
         any_active = i_am_active
@@ -313,17 +529,22 @@ def main_loop(standby_list, this_node, priority):
         if not i_am_active:
             deactivate_tegu()
 
-        # Check for active tegus
-        for host in standby_list:
-            if host == this_node:
-                continue
-
-            host_active = is_active(host)
+        # Check for active tegus; ping everyone at once, then resolve any
+        # split brain serially so deactivations happen in list order
+        others = [host for host in standby_list if host != this_node]
+        active = ping_hosts(others)
+        chkpt_l = None          # our latest chkpt; found once per round if needed
+        for host in others:
+            host_active = active[host]
 
             # Check for split brain: 2 tegus active
             if i_am_active and host_active:
                 logit("checking for split")
-                host_active = should_be_active(host)
+                if chkpt_l is None:
+                    chkpt_l = latest_local_chkpt()
+                # tegu_synch copies to every standby in turn
+                limit = SYNCH_HOST_SEC * (len(standby_list) + 1)
+                host_active = should_be_active(host, chkpt_l, limit)
                 if host_active:
                     logit("deactivate myself, " + host + " already running")
                     deactivate_tegu()      # Deactivate myself
@@ -355,7 +576,8 @@ def main_loop(standby_list, this_node, priority):
 
                 last_start = now
                 priority_wait = False
-                activate_tegu()            # Start local tegu
+                if not activate_tegu():    # Start local tegu
+                    err("unable to start tegu here")
             else:
                 priority_wait = True
     # end loop
@@ -375,36 +597,29 @@ def main():
     if len(this_node.split(".")) > 1:
         fqdn_list.append(this_node.split(".")[0] + cdata["fqmgr"]["phost_suffix"] \
                                             + this_node[this_node.index("."):])
-    ok = False
     mcount = 0                  # critical error after an hour of waiting
-    while not ok:               # loop until we find us
-        ok = True
+    while True:                 # loop until we find us
         # Read list of standby tegu nodes and find us
-        standby_list = [l.strip() for l in open(STDBY_LIST, 'r')]
+        node, priority, standby_list = read_standby_list(fqdn_list)
+        if node is not None:
+            this_node = node
+            break
 
-        try:
-            for fqdn in fqdn_list:
-                if fqdn in standby_list:
-                    priority = standby_list.index(fqdn)
-                    this_node = fqdn
-                    break
-            standby_list.remove(this_node)
-        except ValueError:
-            if mcount == 0:         # dont flood the log
-                logit("Could not find host "+this_node+" in standby list: %s (waiting)" % STDBY_LIST)
-            else:
-                if mcount == 60:
-                    crit("Could not find host "+this_node+" in standby list: %s" % STDBY_LIST)
-                    mcount = 0      # another message in about an hour
-            mcount += 1
-            ok = False
-            time.sleep( 60 )
+        if mcount == 0:         # dont flood the log
+            logit("Could not find host "+this_node+" in standby list: %s (waiting)" % STDBY_LIST)
+        else:
+            if mcount == 60:
+                crit("Could not find host "+this_node+" in standby list: %s" % STDBY_LIST)
+                mcount = 0      # another message in about an hour
+        mcount += 1
+        time.sleep( 60 )
 
     if mcount > 0:
         logit( "finally found host "+this_node+" in standby list: %s" % STDBY_LIST)
 
     # Loop forever listening to heartbeats
-    main_loop(standby_list, this_node, priority)
+    setup_wakeup()
+    main_loop(fqdn_list, standby_list, this_node, priority)
 
 
 if __name__ == '__main__'  or  __name__ == "main":